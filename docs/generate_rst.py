@@ -5,20 +5,36 @@ Usage::
 
     python docs/generate_rst.py            # uses 'nim' from PATH
     NIM=/path/to/nim python docs/generate_rst.py
+    FORCE_REGEN=1 python docs/generate_rst.py   # ignore all caches
 
-Outputs RST files into ``docs/api/`` and a JSON cache into ``docs/_nim_json/``.
-The RST files are then built into HTML by Sphinx.
+Outputs RST files into ``docs/api/`` and a JSON/fingerprint cache into
+``docs/_nim_json/``.  The RST files are then built into HTML by Sphinx.
+``nim jsondoc`` is skipped for modules whose cached JSON is newer than their
+sources, rendering is skipped when a module's inputs are unchanged, and RST
+files are only rewritten when their content changes.
 """
 
 from __future__ import annotations
 
+import functools
+import hashlib
+import itertools
 import json
+import operator
 import os
 import re
 import subprocess
 import sys
+from collections import deque
 from pathlib import Path
 
+try:
+    # Optional: parses bytes directly and is several times faster than json
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 # ---------------------------------------------------------------------------
 # Paths
 # ---------------------------------------------------------------------------
@@ -28,17 +44,24 @@ DOCS_DIR = Path(__file__).parent
 API_DIR = DOCS_DIR / "api"
 NIM_JSON_DIR = DOCS_DIR / "_nim_json"
 
+# Set FORCE_REGEN=1 to bypass the jsondoc and RST caches
+FORCE_REGEN = os.environ.get("FORCE_REGEN") == "1"
+
 # ---------------------------------------------------------------------------
-# Module list  (module_name, source_path, human_title)
+# Module list  (module_name, source path under src/, human_title)
+# Paths are resolved once at import time.
 # ---------------------------------------------------------------------------
-MODULES: list[tuple[str, Path, str]] = [
-    ("nimpulseqgui",   SRC_DIR / "nimpulseqgui.nim",                   "nimpulseqgui — Top-level API"),
-    ("definitions",    SRC_DIR / "nimpulseqgui" / "definitions.nim",   "definitions — Core types"),
-    ("sequenceexe",    SRC_DIR / "nimpulseqgui" / "sequenceexe.nim",   "sequenceexe — CLI entry point"),
-    ("sequencegui",    SRC_DIR / "nimpulseqgui" / "sequencegui.nim",   "sequencegui — Main GUI window"),
-    ("propertyedit",   SRC_DIR / "nimpulseqgui" / "propertyedit.nim",  "propertyedit — Property editors"),
-    ("io",             SRC_DIR / "nimpulseqgui" / "io.nim",            "io — Protocol persistence"),
-]
+MODULES: tuple[tuple[str, Path, str], ...] = tuple(
+    (name, (SRC_DIR / rel).resolve(), title)
+    for name, rel, title in (
+        ("nimpulseqgui",   "nimpulseqgui.nim",                "nimpulseqgui — Top-level API"),
+        ("definitions",    "nimpulseqgui/definitions.nim",    "definitions — Core types"),
+        ("sequenceexe",    "nimpulseqgui/sequenceexe.nim",    "sequenceexe — CLI entry point"),
+        ("sequencegui",    "nimpulseqgui/sequencegui.nim",    "sequencegui — Main GUI window"),
+        ("propertyedit",   "nimpulseqgui/propertyedit.nim",   "propertyedit — Property editors"),
+        ("io",             "nimpulseqgui/io.nim",             "io — Protocol persistence"),
+    )
+)
 
 # Symbol kind → section heading (and display order)
 _KIND_ORDER = [
@@ -65,156 +88,301 @@ _KIND_LABELS: dict[str, str] = {
     "skLet":      "Lets",
     "skVar":      "Variables",
 }
+_KIND_INDEX: dict[str, int] = {kind: i for i, kind in enumerate(_KIND_ORDER)}
+_SECTION_BAR: dict[str, str] = {lbl: "-" * len(lbl) for lbl in _KIND_LABELS.values()}
 
 
 # ---------------------------------------------------------------------------
 # HTML → RST helpers
 # ---------------------------------------------------------------------------
 
-def _html_to_rst(html: str) -> str:
-    """Convert nim jsondoc HTML description fragment to plain RST."""
-    if not html:
-        return ""
-
-    # <tt class="docutils literal"><span class="pre"><span class="...">TEXT</span></span></tt>
-    # → ``TEXT``
-    def _replace_tt(m: re.Match) -> str:
-        inner = re.sub(r"<[^>]+>", "", m.group(1))
-        return f"``{inner}``"
-
-    text = re.sub(r"<tt[^>]*>(.*?)</tt>", _replace_tt, html, flags=re.DOTALL)
-
-    # <p>...</p> → paragraph with blank lines
-    text = re.sub(r"<p>(.*?)</p>", r"\1\n\n", text, flags=re.DOTALL)
+# Common HTML entities, decoded in the same pass as the tags
+_ENTITIES: dict[str, str] = {
+    "&lt;":   "<",
+    "&gt;":   ">",
+    "&amp;":  "&",
+    "&quot;": '"',
+    "&#39;":  "'",
+    "&nbsp;": " ",
+}
 
-    # <b>/<strong> → **bold**
-    text = re.sub(r"<(?:b|strong)>(.*?)</(?:b|strong)>", r"**\1**", text)
+# Tag ("name" or "/name") → replacement; any tag not listed here is dropped
+_TAG_MARKUP: dict[str, str] = {
+    "p":      "",     "/p":      "\n\n",
+    "ul":     "\n",   "/ul":     "\n",
+    "li":     "\n- ", "/li":     "",
+}
 
-    # <em>/<i> → *italic*
-    text = re.sub(r"<(?:em|i)>(.*?)</(?:em|i)>", r"*\1*", text)
+# Inline markup only applies to a matched open/close pair, so a stray tag
+# is dropped instead of leaving an unbalanced ``**`` or ``*``
+_INLINE_MARKUP: dict[str, str] = {
+    "b":      "**",
+    "strong": "**",
+    "em":     "*",
+    "i":      "*",
+}
 
-    # <ul>/<li> → RST bullet list
-    text = re.sub(r"<ul[^>]*>", "\n", text)
-    text = re.sub(r"</ul>", "\n", text)
-    text = re.sub(r"<li>(.*?)</li>", r"\n- \1", text, flags=re.DOTALL)
+_ENTITY_PATTERN = "|".join(map(re.escape, _ENTITIES))
+
+# One token per <tt>...</tt> literal, inline markup pair, other tag, or
+# supported entity
+_TOKEN_RE = re.compile(
+    r"<tt[^>]*>(?P<tt>.*?)</tt>"
+    r"|<(?P<inline>b|strong|em|i)>(?P<inner>.*?)</(?P=inline)>"
+    r"|<(?!>)(?P<tag>/?\w*)[^>]*>"
+    r"|" + _ENTITY_PATTERN,
+    re.DOTALL,
+)
+# Inside a literal every tag is dropped and only entities are decoded
+_LITERAL_TOKEN_RE = re.compile(r"<[^>]+>|" + _ENTITY_PATTERN)
+_BLANK_RE = re.compile(r"\n{3,}")
+
+
+def _replace_token(m: re.Match) -> str:
+    tag = m["tag"]
+    if tag is not None:
+        return _TAG_MARKUP.get(tag, "")
+    tt = m["tt"]
+    if tt is not None:
+        # <tt class="docutils literal"><span class="pre"><span class="...">TEXT</span></span></tt>
+        # → ``TEXT``
+        if "<" in tt or "&" in tt:
+            tt = _LITERAL_TOKEN_RE.sub(lambda t: _ENTITIES.get(t[0], ""), tt)
+        return f"``{tt}``"
+    inline = m["inline"]
+    if inline is not None:
+        marker = _INLINE_MARKUP[inline]
+        return f"{marker}{_TOKEN_RE.sub(_replace_token, m['inner'])}{marker}"
+    return _ENTITIES[m[0]]
+
+
+@functools.lru_cache(maxsize=4096)
+def _html_to_rst(html: str) -> str:
+    """Convert nim jsondoc HTML description fragment to plain RST.
 
-    # Strip any remaining tags
-    text = re.sub(r"<[^>]+>", "", text)
+    Tags and entities are rewritten in one scan of the input. Memoized:
+    overloads and stock one-liners often share the same fragment.
+    """
+    if not html:
+        return ""
 
-    # Decode common HTML entities
-    text = (
-        text.replace("&lt;", "<")
-            .replace("&gt;", ">")
-            .replace("&amp;", "&")
-            .replace("&quot;", '"')
-            .replace("&#39;", "'")
-            .replace("&nbsp;", " ")
-    )
+    # Plain-text fragments skip the regex passes; ``in`` is a cheap C scan
+    text = html
+    if "<" in text or "&" in text:
+        text = _TOKEN_RE.sub(_replace_token, text)
 
     # Normalise whitespace: collapse multiple blank lines
-    text = re.sub(r"\n{3,}", "\n\n", text)
+    if "\n\n\n" in text:
+        text = _BLANK_RE.sub("\n\n", text)
     return text.strip()
 
 
 _PRAGMA_RE = re.compile(r"\s*\{\..*?\.\}", re.DOTALL)
 
 
+@functools.lru_cache(maxsize=4096)
 def _clean_code(code: str) -> str:
     """Strip Nim compiler pragmas from a proc signature."""
-    return _PRAGMA_RE.sub("", code).strip()
+    # Most consts, types and vars carry no pragma; skip the regex for them
+    return (_PRAGMA_RE.sub("", code) if "{." in code else code).strip()
 
 
 # ---------------------------------------------------------------------------
 # nim jsondoc runner
 # ---------------------------------------------------------------------------
 
-def _run_jsondoc(nim_file: Path, out_file: Path) -> bool:
-    """Invoke ``nim jsondoc`` and write JSON to *out_file*. Returns True on success."""
+@functools.lru_cache(maxsize=None)
+def _dir_max_mtime(d: str) -> float:
+    """Return the newest mtime of any ``.nim`` file under directory *d*."""
+    newest = 0.0
+    pending = [d]
+    while pending:
+        with os.scandir(pending.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.name.endswith(".nim"):
+                    newest = max(newest, entry.stat().st_mtime)
+    return newest
+
+
+def _jsondoc_up_to_date(nim_file: Path, out_file: Path) -> bool:
+    """Return True if *out_file* can be reused instead of re-running jsondoc.
+
+    That is the case when it is newer than every ``.nim`` file under the
+    module's directory (a cheap stand-in for its imports).
+    """
+    if FORCE_REGEN or not out_file.exists():
+        return False
+    return out_file.stat().st_mtime >= _dir_max_mtime(str(nim_file.parent))
+
+
+def _tmp_json(out_file: Path) -> Path:
+    """Return the scratch path jsondoc writes to before it replaces *out_file*."""
+    return out_file.with_suffix(out_file.suffix + ".tmp")
+
+
+def _spawn_jsondoc(nim_file: Path, out_file: Path) -> subprocess.Popen | None:
+    """Start ``nim jsondoc`` for *nim_file*. Returns None if nim is missing.
+
+    Output goes to a temporary file that :func:`_finish_jsondoc` moves over
+    *out_file* on success, so a failed run never leaves a partial JSON that
+    looks newer than its sources.
+    """
     out_file.parent.mkdir(parents=True, exist_ok=True)
     nim_exe = os.environ.get("NIM", "nim")
     try:
-        result = subprocess.run(
-            [nim_exe, "jsondoc", "--hints:off", f"--out:{out_file}", str(nim_file)],
+        return subprocess.Popen(
+            [
+                nim_exe, "jsondoc", "--hints:off", "--verbosity:0",
+                f"--out:{_tmp_json(out_file)}", str(nim_file),
+            ],
             cwd=REPO_ROOT,
-            capture_output=True,
-            text=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
         )
-        if result.returncode != 0:
-            print(
-                f"  Warning: nim jsondoc failed for {nim_file.name}:\n"
-                f"    {result.stderr.strip()[:300]}",
-                file=sys.stderr,
-            )
-            return False
-        if not out_file.exists():
-            print(f"  Warning: {out_file} was not created.", file=sys.stderr)
-            return False
-        return True
     except FileNotFoundError:
         print(
             "  Error: 'nim' executable not found.\n"
             "  Set the NIM environment variable or ensure nim is in PATH.",
             file=sys.stderr,
         )
+        return None
+
+
+def _finish_jsondoc(proc: subprocess.Popen | None, nim_file: Path, out_file: Path) -> bool:
+    """Wait for a process from :func:`_spawn_jsondoc`. Returns True on success.
+
+    stderr is captured as bytes and only decoded when it is reported.
+    """
+    if proc is None:
         return False
+    _, stderr = proc.communicate()
+    tmp_file = _tmp_json(out_file)
+    if proc.returncode != 0:
+        tmp_file.unlink(missing_ok=True)
+        print(
+            f"  Warning: nim jsondoc failed for {nim_file.name}:\n"
+            f"    {stderr.decode('utf-8', errors='replace').strip()[:300]}",
+            file=sys.stderr,
+        )
+        return False
+    if not tmp_file.exists():
+        print(f"  Warning: {tmp_file} was not created.", file=sys.stderr)
+        return False
+    os.replace(tmp_file, out_file)
+    return True
 
 
 # ---------------------------------------------------------------------------
 # RST generation
 # ---------------------------------------------------------------------------
 
-def _make_module_rst(module_name: str, title: str, data: dict) -> str:
-    """Return the full RST string for one module."""
+_CODE_BLOCK = ".. code-block:: nim"
+
+
+# Changes to the renderer must invalidate pages rendered by an older version
+_GENERATOR_DIGEST = hashlib.sha256(Path(__file__).read_bytes()).digest()
+
+
+def _fingerprint(module_name: str, title: str, data: dict) -> str:
+    """Return a SHA-256 hex digest of everything that goes into a module RST.
+
+    Covers the generator itself, the page title, the module description and
+    the ``(name, type, code, description)`` of every entry. It is computed
+    from the raw jsondoc fields so that a match skips all conversion work.
+    """
+    h = hashlib.sha256(_GENERATOR_DIGEST)
+    for field in (module_name, title, data.get("moduleDescription", "")):
+        h.update(field.encode("utf-8"))
+        h.update(b"\0")
+    for entry in data.get("entries", []):
+        for key in ("name", "type", "code", "description"):
+            h.update(str(entry.get(key, "")).encode("utf-8"))
+            h.update(b"\0")
+    return h.hexdigest()
+
+
+def _fingerprint_file(module_name: str) -> Path:
+    """Return the sidecar file holding the fingerprint of the module's last render."""
+    return NIM_JSON_DIR / f"{module_name}.fingerprint"
+
+
+def _read_fingerprint(path: Path) -> str | None:
+    """Return the fingerprint stored in *path*, or None if there is none."""
+    try:
+        return path.read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def _tilde(n: int) -> str:
+    """Return a ``~`` underline of length *n* (symbol names cluster in length)."""
+    return "~" * n
+
+
+def _read_entries(data: dict) -> list[tuple[str, str, str, str]]:
+    """Return ``(kind, name, code, description)`` for every documented entry.
+
+    Code is already stripped of pragmas and the description converted to RST;
+    kinds without a section are dropped.
+    """
+    return [
+        (kind, e["name"], _clean_code(e.get("code", "")), _html_to_rst(e.get("description", "")))
+        for e in data.get("entries", [])
+        if (kind := e.get("type", "skProc")) in _KIND_INDEX
+    ]
+
+
+def _make_module_rst(
+    module_name: str,
+    title: str,
+    module_desc: str,
+    entries: list[tuple[str, str, str, str]],
+) -> str:
+    """Return the full RST string for one module.
+
+    *module_desc* is RST and *entries* come from :func:`_read_entries`.
+    """
     lines: list[str] = []
 
     # Page title (double overline/underline)
     bar = "=" * len(title)
-    lines += [bar, title, bar, ""]
+    lines.extend((bar, title, bar, ""))
 
-    module_desc = _html_to_rst(data.get("moduleDescription", ""))
     if module_desc:
-        lines += [module_desc, ""]
+        lines.extend((module_desc, ""))
 
-    # Group entries by kind, preserving source order within each group
-    by_kind: dict[str, list[dict]] = {}
-    for entry in data.get("entries", []):
-        kind = entry.get("type", "skProc")
-        by_kind.setdefault(kind, []).append(entry)
+    # Group entries by kind; the sort is stable, so source order is kept
+    # within each group
+    entries = sorted(entries, key=lambda e: _KIND_INDEX[e[0]])
 
-    for kind in _KIND_ORDER:
-        entries = by_kind.get(kind)
-        if not entries:
-            continue
-
-        section = _KIND_LABELS.get(kind, kind)
-        lines += [section, "-" * len(section), ""]
+    for kind, group in itertools.groupby(entries, key=operator.itemgetter(0)):
+        section = _KIND_LABELS[kind]
+        lines.extend((section, _SECTION_BAR[section], ""))
 
         # Track seen names to disambiguate overloaded symbols
         name_count: dict[str, int] = {}
 
-        for entry in entries:
-            name = entry["name"]
-            code = _clean_code(entry.get("code", ""))
-            desc = _html_to_rst(entry.get("description", ""))
-
+        for _, name, code, desc in group:
             # Unique Sphinx cross-reference label for overloaded procs
             count = name_count.get(name, 0)
             name_count[name] = count + 1
             label = f"{module_name}.{name}" if count == 0 else f"{module_name}.{name}.{count}"
-            lines += [f".. _{label}:", ""]
+            lines.extend((f".. _{label}:", ""))
 
             # Symbol heading; append overload index when name repeats
             heading = name if count == 0 else f"{name} ({count + 1})"
-            lines += [heading, "~" * len(heading), ""]
+            lines.extend((heading, _tilde(len(heading)), ""))
 
             if code:
-                lines += [".. code-block:: nim", ""]
-                for code_line in code.splitlines():
-                    lines.append("   " + code_line)
+                lines.extend((_CODE_BLOCK, ""))
+                lines.extend("   " + code_line for code_line in code.splitlines())
                 lines.append("")
 
             if desc:
-                lines += [desc, ""]
+                lines.extend((desc, ""))
 
     return "\n".join(lines) + "\n"
 
@@ -235,49 +403,108 @@ def _make_api_index(generated: list[str]) -> str:
         "   :caption: Modules",
         "",
     ]
-    for name in generated:
-        lines.append(f"   {name}")
+    lines.extend(f"   {name}" for name in generated)
     lines.append("")
     return "\n".join(lines)
 
 
+def _write_if_changed(path: Path, content: str) -> bool:
+    """Write *content* to *path* unless it already matches. Returns True if written.
+
+    Leaving unchanged files alone keeps their mtime, so Sphinx's incremental
+    build does not re-read them.
+    """
+    if path.exists() and path.read_text(encoding="utf-8") == content:
+        return False
+    path.write_text(content, encoding="utf-8")
+    return True
+
+
 # ---------------------------------------------------------------------------
 # Main
 # ---------------------------------------------------------------------------
 
+def _process_module(module_name: str, title: str, jsondoc_ok: bool) -> tuple[bool, str]:
+    """Parse the jsondoc output and write the RST page for one module.
+
+    Returns ``(ok, status)``; *status* is the text for the module's progress line.
+    """
+    if not jsondoc_ok:
+        return False, "FAILED"
+
+    json_file = NIM_JSON_DIR / f"{module_name}.json"
+    try:
+        data = _json_loads(json_file.read_bytes())
+    except (ValueError, OSError) as exc:
+        return False, f"FAILED (JSON parse: {exc})"
+
+    rst_file = API_DIR / f"{module_name}.rst"
+    fingerprint_file = _fingerprint_file(module_name)
+    fingerprint = _fingerprint(module_name, title, data)
+    if (
+        not FORCE_REGEN
+        and rst_file.exists()
+        and _read_fingerprint(fingerprint_file) == fingerprint
+    ):
+        return True, "(unchanged)"
+
+    # Keep only what the renderer needs and release the parsed JSON
+    module_desc = _html_to_rst(data.get("moduleDescription", ""))
+    entries = _read_entries(data)
+    del data
+
+    rst_content = _make_module_rst(module_name, title, module_desc, entries)
+    written = _write_if_changed(rst_file, rst_content)
+    # Recorded only once the page is current, even if its content did not
+    # change (e.g. pragma-only churn), so the next run can skip this module
+    _write_if_changed(fingerprint_file, fingerprint)
+    if written:
+        return True, f"-> docs/api/{module_name}.rst"
+    return True, "(unchanged)"
+
+
 def main() -> int:
     API_DIR.mkdir(parents=True, exist_ok=True)
     NIM_JSON_DIR.mkdir(parents=True, exist_ok=True)
 
-    generated: list[str] = []
-    errors: list[str] = []
+    # The nim jsondoc runs dominate wall time and are independent, so start
+    # them all up front (at most max_in_flight at once) and collect later.
+    max_in_flight = os.cpu_count() or 4
+    jsondoc_ok: dict[str, bool] = {}
+    running: deque[tuple[str, Path, Path, subprocess.Popen | None]] = deque()
 
-    for module_name, nim_file, title in MODULES:
-        print(f"  [{module_name}]", end=" ", flush=True)
-        json_file = NIM_JSON_DIR / f"{module_name}.json"
+    def _finish_oldest() -> None:
+        module_name, nim_file, json_file, proc = running.popleft()
+        jsondoc_ok[module_name] = _finish_jsondoc(proc, nim_file, json_file)
 
-        if not _run_jsondoc(nim_file, json_file):
-            errors.append(module_name)
-            print("FAILED")
-            continue
-
-        try:
-            data = json.loads(json_file.read_text())
-        except (json.JSONDecodeError, OSError) as exc:
-            print(f"FAILED (JSON parse: {exc})")
-            errors.append(module_name)
+    for module_name, nim_file, _ in MODULES:
+        json_file = NIM_JSON_DIR / f"{module_name}.json"
+        if _jsondoc_up_to_date(nim_file, json_file):
+            jsondoc_ok[module_name] = True
             continue
+        if len(running) >= max_in_flight:
+            _finish_oldest()
+        running.append((module_name, nim_file, json_file, _spawn_jsondoc(nim_file, json_file)))
+    while running:
+        _finish_oldest()
+
+    # Progress is collected and written in one go at the end
+    log: list[str] = []
+    generated: list[str] = []
+    errors: list[str] = []
 
-        rst_content = _make_module_rst(module_name, title, data)
-        rst_file = API_DIR / f"{module_name}.rst"
-        rst_file.write_text(rst_content, encoding="utf-8")
-        generated.append(module_name)
-        print(f"-> docs/api/{module_name}.rst")
+    for module_name, _, title in MODULES:
+        ok, status = _process_module(module_name, title, jsondoc_ok[module_name])
+        (generated if ok else errors).append(module_name)
+        log.append(f"  [{module_name}] {status}\n")
 
-    # Write api/index.rst
+    # Write api/index.rst; it only changes when the set of generated modules does
     index_rst = API_DIR / "index.rst"
-    index_rst.write_text(_make_api_index(generated), encoding="utf-8")
-    print(f"\nWrote docs/api/index.rst  ({len(generated)} modules)")
+    if _write_if_changed(index_rst, _make_api_index(generated)):
+        log.append(f"\nWrote docs/api/index.rst  ({len(generated)} modules)\n")
+    else:
+        log.append(f"\ndocs/api/index.rst unchanged  ({len(generated)} modules)\n")
+    sys.stdout.write("".join(log))
 
     if errors:
         print(f"\nFailed modules: {', '.join(errors)}", file=sys.stderr)